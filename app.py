@@ -1,14 +1,29 @@
+import io
 import os
 import re
 import json
-from typing import Dict, List
+import time
+import hashlib
+import functools
+import tempfile
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
 
 import streamlit as st
 import requests
+import httpx
+import tenacity
 import fitz  # PyMuPDF
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from src.pdfqa.utils import TEXT_FLAGS, extract_page_range, init_extract_worker
+
 # Optional: load .env into environment (install python-dotenv)
 try:
     from dotenv import load_dotenv
@@ -18,16 +33,74 @@ except Exception:
     # python-dotenv is optional; the app still works if not installed and env vars/st.secrets are used
     pass
 
+# Optional: on-disk cache of model responses (install diskcache)
+try:
+    import diskcache
+except Exception:
+    # diskcache is optional; without it every call goes to the API
+    diskcache = None
+
+# Optional: token-accurate chunking (install tiktoken)
+try:
+    import tiktoken
+except Exception:
+    # tiktoken is optional; chunking falls back to character counts
+    tiktoken = None
+
 # -----------------------
 # Defaults & config
 # -----------------------
 API_URL_DEFAULT = "https://openrouter.ai/api/v1/chat/completions"
 MODEL_DEFAULT = "openai/gpt-3.5-turbo-0613"
+HTTPX_LIMITS = httpx.Limits(max_connections=32)
+# Upper bound on in-flight summarize calls, to stay under provider rate limits
+MAX_CONCURRENCY = int(os.environ.get("PDFQA_MAX_CONCURRENCY", "10"))
+# Documents with more chunks than this are summarized in waves of SUMMARY_BATCH_SIZE
+LARGE_DOC_CHUNKS = 50
+SUMMARY_BATCH_SIZE = 10
+# Longest a question waits for the live summarize stage before giving up
+SUMMARIES_TIMEOUT = float(os.environ.get("PDFQA_SUMMARIES_TIMEOUT", "600"))
+# PDFs with fewer pages are extracted in-process. Sequential extraction costs ~1.4 ms per text-heavy
+# page, while starting a spawn pool costs ~0.4 s, so a pool only pays off from ~500 pages on 2+ CPUs.
+PARALLEL_EXTRACT_MIN_PAGES = 500
+EXTRACT_PAGES_PER_TASK = 10
+# Documents up to this size skip the summarize stage and go to the model in one prompt
+# (character fallback; with tiktoken the limit is DIRECT_PROMPT_MAX_TOKENS)
+DIRECT_PROMPT_MAX_CHARS = int(os.environ.get("PDFQA_DIRECT_PROMPT_MAX_CHARS", "12000"))
+# OpenAI-compatible Batch API base (files + batches endpoints); OpenRouter does not offer one
+BATCH_API_BASE_DEFAULT = os.environ.get("PDFQA_BATCH_API_BASE", "https://api.openai.com/v1")
+# Chunks packed into one summarize prompt; K * chunk size must still fit the model context
+CHUNKS_PER_CALL = int(os.environ.get("PDFQA_CHUNKS_PER_CALL", "2"))
+# Token budget per chunk: ~75% of the context left after output and prompt overhead, shared
+# by the CHUNKS_PER_CALL chunks in one request (over-packing a prompt hurts latency)
+MODEL_CONTEXT_TOKENS = int(os.environ.get("PDFQA_MODEL_CONTEXT_TOKENS", "4096"))
+RESERVED_OUTPUT_TOKENS = 512
+PROMPT_OVERHEAD_TOKENS = 128
+CHUNK_MAX_TOKENS = int(0.75 * (MODEL_CONTEXT_TOKENS - RESERVED_OUTPUT_TOKENS - PROMPT_OVERHEAD_TOKENS)) // max(
+    CHUNKS_PER_CALL, 1
+)
+DIRECT_PROMPT_MAX_TOKENS = MODEL_CONTEXT_TOKENS - RESERVED_OUTPUT_TOKENS - PROMPT_OVERHEAD_TOKENS
+_HEADING_RE = re.compile(
+    r"^(?:CHAPTER|SECTION|PART|INTRODUCTION|CONCLUSION|SUMMARY|APPENDIX)\b",
+    re.IGNORECASE,
+)
+_NUMBER_PREFIX_RE = re.compile(r"^\s*\d+[\).\s-]*")
+# tolerates markdown decoration models add around the label, e.g. "**SUMMARY 1:**" or "- Summary 2 -:"
+_MARSHALED_SUMMARY_RE = re.compile(r"^\W*SUMMARY\s+(\d+)\W*?:[*_]*", re.MULTILINE | re.IGNORECASE)
+SUMMARY_SYSTEM_MSG = {
+    "role": "system",
+    "content": "You are a concise summarizer. Summarize the following chunk in 2-3 short sentences, focusing on facts that would help answer user questions.",
+}
+MARSHALED_SUMMARY_SYSTEM_MSG = {
+    "role": "system",
+    "content": "You are a concise summarizer. Summarize each of the numbered chunks that follow separately in 2-3 short sentences, focusing on facts that would help answer user questions.",
+}
 
 
 # -----------------------
 # Utility: HTTP session with retries
 # -----------------------
+@st.cache_resource(show_spinner=False)
 def create_requests_session(retries: int = 3, backoff_factor: float = 0.3) -> requests.Session:
     session = requests.Session()
     retry = Retry(
@@ -44,6 +117,53 @@ def create_requests_session(retries: int = 3, backoff_factor: float = 0.3) -> re
     return session
 
 
+@st.cache_resource(show_spinner=False)
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Event loop running in a daemon thread and shared across Streamlit reruns, so
+    async HTTP connections stay pooled instead of dying with a per-call asyncio.run loop.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="pdfqa-event-loop", daemon=True).start()
+    return loop
+
+
+def start_async(coro) -> Future:
+    """Schedule a coroutine on the shared event loop without waiting for it."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+
+def run_async(coro):
+    """Run a coroutine on the shared event loop and block until it finishes."""
+    return start_async(coro).result()
+
+
+@st.cache_resource(show_spinner=False)
+def get_async_client(timeout: float = 20) -> httpx.AsyncClient:
+    """Pooled httpx.AsyncClient; only used from coroutines on get_event_loop()."""
+    return httpx.AsyncClient(timeout=timeout, limits=HTTPX_LIMITS)
+
+
+@st.cache_resource(show_spinner=False)
+def get_request_semaphore() -> asyncio.Semaphore:
+    """
+    Process-wide cap of MAX_CONCURRENCY in-flight summary calls, shared by every session,
+    prefetch and fallback pass; only used from coroutines on get_event_loop().
+    """
+    return asyncio.Semaphore(MAX_CONCURRENCY)
+
+
+@st.cache_resource(show_spinner=False)
+def get_llm_cache():
+    """On-disk response cache opened once per process, or None without diskcache (or a writable dir)."""
+    if diskcache is None:
+        return None
+    try:
+        return diskcache.Cache(os.environ.get("PDFQA_CACHE_DIR", ".llmcache"))
+    except Exception:
+        return None
+
+
 # -----------------------
 # API key resolution
 # -----------------------
@@ -61,40 +181,108 @@ def get_api_key_from_secrets_or_env() -> str:
     return os.environ.get("OPENROUTER_API_KEY", "") or os.environ.get("OPENROUTER_KEY", "")
 
 
+def get_batch_api_key_from_secrets_or_env() -> str:
+    """
+    Key for the Batch API endpoint (PDFQA_BATCH_API_KEY, then OPENAI_API_KEY), from
+    st.secrets then the environment. Never falls back to the OpenRouter key, which must
+    not be sent to a different provider.
+    """
+    names = ("PDFQA_BATCH_API_KEY", "OPENAI_API_KEY")
+    try:
+        if isinstance(st.secrets, dict):
+            for name in names:
+                if st.secrets.get(name):
+                    return st.secrets[name]
+    except Exception:
+        # st.secrets may not be dict-like in all environments; ignore and fallback
+        pass
+    return next((os.environ[name] for name in names if os.environ.get(name)), "")
+
+
 # -----------------------
 # PDF extraction & structuring
 # -----------------------
 @st.cache_data(show_spinner=False)
-def extract_text_from_pdf_bytes(file_bytes: bytes) -> str:
-    """Extract plain text from PDF bytes using PyMuPDF (fitz)."""
+def extract_text_from_pdf_bytes(digest: str, _file_bytes: bytes) -> str:
+    """
+    Extract plain text from PDF bytes using PyMuPDF (fitz).
+    Cached on `digest` (a content hash of the PDF computed once per upload); the leading
+    underscore stops Streamlit from re-hashing the whole file on every rerun.
+    Large PDFs are split into page ranges and extracted across a process pool.
+    Page texts are written into one buffer as they arrive rather than collected and joined.
+    """
     try:
-        doc = fitz.open(stream=file_bytes, filetype="pdf")
-        pages = [page.get_text("text") for page in doc]
-        return "\n".join(pages).strip()
+        doc = fitz.open(stream=_file_bytes, filetype="pdf")
+        page_count = doc.page_count
+        if page_count >= PARALLEL_EXTRACT_MIN_PAGES and _available_cpus() > 1:
+            try:
+                return _extract_text_parallel(_file_bytes, page_count)
+            except (BrokenProcessPool, OSError):
+                # a worker died or the pool could not start (e.g. process limits): extract in-process
+                pass
+        buf = io.StringIO()
+        for page in doc:
+            buf.write(page.get_text("text", flags=TEXT_FLAGS))
+            buf.write("\n")
+        # the trailing separator is dropped by strip(), matching "\n".join(pages).strip()
+        return buf.getvalue().strip()
     except Exception:
         return ""
 
 
+def _available_cpus() -> int:
+    """CPUs this process may run on (respects affinity/cpusets where the OS exposes them)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _extract_text_parallel(file_bytes: bytes, page_count: int) -> str:
+    """Extract page ranges across a process pool; raises BrokenProcessPool if a worker dies."""
+    starts = list(range(0, page_count, EXTRACT_PAGES_PER_TASK))
+    stops = [min(start + EXTRACT_PAGES_PER_TASK, page_count) for start in starts]
+    workers = min(_available_cpus(), len(starts))
+    buf = io.StringIO()
+    # workers open a temp copy by path instead of each unpickling the whole PDF into its own memory
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(file_bytes)
+    try:
+        # spawn, not fork: forking the Streamlit server would copy its threads, locks and event loop
+        # each worker opens the document once, then extracts the ranges it is handed
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_extract_worker,
+            initargs=(tmp.name,),
+        ) as pool:
+            for part in pool.map(extract_page_range, starts, stops):
+                for text in part:
+                    buf.write(text)
+                    buf.write("\n")
+    finally:
+        os.remove(tmp.name)
+    return buf.getvalue().strip()
+
+
 def structure_pdf_content(raw_text: str) -> Dict[str, str]:
     """
     Heuristically split a raw text into sections using uppercase headings and common keywords.
     Returns a dict: {heading: content}.
     """
     sections: Dict[str, List[str]] = {"Introduction": []}
-    current = "Introduction"
-    heading_pattern = re.compile(
-        r"^(?:CHAPTER|SECTION|PART|INTRODUCTION|CONCLUSION|SUMMARY|APPENDIX)\b",
-        re.IGNORECASE,
-    )
-    for line in raw_text.splitlines():
-        line = line.strip()
+    body = sections["Introduction"]
+    is_keyword_heading = _HEADING_RE.match
+    # A whole-text re.finditer scan for heading lines benchmarks at parity with this loop once
+    # isupper()/strip() semantics are reproduced exactly, so the simpler loop is kept.
+    for line in map(str.strip, raw_text.splitlines()):
         if not line:
             continue
-        if line.isupper() or heading_pattern.match(line):
-            current = line
-            sections.setdefault(current, [])
+        if line.isupper() or is_keyword_heading(line):
+            # keep a direct handle on the current section's list instead of a dict lookup per line
+            body = sections.setdefault(line, [])
         else:
-            sections.setdefault(current, []).append(line)
+            body.append(line)
     return {sec: " ".join(txt) for sec, txt in sections.items()}
 
 
@@ -102,7 +290,11 @@ def structure_pdf_content(raw_text: str) -> Dict[str, str]:
 # Chunking helpers
 # -----------------------
 def chunk_text(text: str, max_chars: int = 3500) -> List[str]:
-    """Naive character-based chunker that prefers splitting on newlines or spaces."""
+    """
+    Naive character-based chunker that prefers splitting on newlines or spaces.
+    Split points come from rfind bounded to the current window (a C-level backwards scan that
+    stops at the first hit), so a pass is linear in len(text) without a precomputed index.
+    """
     if not text:
         return []
     if len(text) <= max_chars:
@@ -125,9 +317,66 @@ def chunk_text(text: str, max_chars: int = 3500) -> List[str]:
     return chunks
 
 
+@st.cache_resource(show_spinner=False)
+def get_token_encoding(name: str = "cl100k_base"):
+    """
+    tiktoken encoding, or None if tiktoken or its BPE file is unavailable (e.g. offline).
+    Held per process so a failed download is not retried on every rerun.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception:
+        return None
+
+
+def chunk_text_by_tokens(text: str, max_tokens: int, encoding) -> List[str]:
+    """
+    Token-counted variant of chunk_text. Each chunk holds at most `max_tokens` tokens and is cut
+    after the last newline-bearing token in its window, else before the last space-led token,
+    else at the last token that starts a UTF-8 character (unspaced CJK text), so no character
+    is split across chunks.
+    """
+    if not text:
+        return []
+    ids = encoding.encode(text, disallowed_special=())
+    if len(ids) <= max_tokens:
+        return [text]
+    token_bytes = encoding.decode_single_token_bytes
+    n = len(ids)
+
+    def starts_char(i: int) -> bool:
+        # byte-level tokens may end mid-character; UTF-8 continuation bytes are 0b10xxxxxx
+        return i >= n or token_bytes(ids[i])[0] & 0xC0 != 0x80
+
+    chunks = []
+    start = 0
+    while start < n:
+        end = start + max_tokens
+        if end >= n:
+            chunks.append(encoding.decode(ids[start:]).strip())
+            break
+        split_at = next(
+            (i + 1 for i in range(end - 1, start, -1) if b"\n" in token_bytes(ids[i]) and starts_char(i + 1)), None
+        )
+        if split_at is None:
+            split_at = next((i for i in range(end - 1, start, -1) if token_bytes(ids[i]).startswith(b" ")), None)
+        if split_at is None:
+            split_at = next((i for i in range(end, start, -1) if starts_char(i)), end)
+        chunks.append(encoding.decode(ids[start:split_at]).strip())
+        start = split_at
+    return chunks
+
+
 # -----------------------
 # OpenRouter API wrapper
 # -----------------------
+def response_cache_key(model: str, messages: List[dict]) -> str:
+    """Content-addressed key for a chat completion request."""
+    return hashlib.sha256(json.dumps({"m": model, "ms": messages}, sort_keys=True).encode("utf-8")).hexdigest()
+
+
 def call_openrouter(
     messages: List[dict],
     api_key: str,
@@ -135,17 +384,201 @@ def call_openrouter(
     api_url: str = API_URL_DEFAULT,
     timeout: int = 20,
 ) -> dict:
-    """POST to the OpenRouter-compatible chat completions endpoint and return parsed JSON."""
+    """
+    POST to the OpenRouter-compatible chat completions endpoint and return parsed JSON.
+    Responses are served from / stored in get_llm_cache() when diskcache is available; only
+    responses with non-empty assistant content are stored.
+    """
     if not api_key:
         raise RuntimeError("OPENROUTER_API_KEY not set. Provide the key via st.secrets or environment variable.")
+    key = response_cache_key(model, messages)
+    cache = get_llm_cache()
+    if cache is not None and key in cache:
+        return cache[key]
     headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
     payload = {"model": model, "messages": messages}
     session = create_requests_session()
     resp = session.post(api_url, headers=headers, json=payload, timeout=timeout)
     resp.raise_for_status()
+    data = resp.json()
+    # a 2xx can still carry {"error": ...} or an empty choice; only usable answers are kept
+    if cache is not None and safe_json_get_choice_content(data).strip():
+        cache[key] = data
+    return data
+
+
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+RETRY_ATTEMPTS = 5
+# Upper bound on any single backoff sleep, including a server-supplied Retry-After
+RETRY_MAX_WAIT = 30.0
+# Randomized exponential backoff, so parallel requests that failed together don't retry together
+_JITTERED_WAIT = tenacity.wait_random_exponential(multiplier=0.5, max=RETRY_MAX_WAIT)
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    """Retry network errors and throttling/server errors; other HTTP errors (e.g. 401) fail fast."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRY_STATUS_CODES
+    return isinstance(exc, httpx.TransportError)
+
+
+def _retry_after_seconds(resp: httpx.Response) -> Optional[float]:
+    """Parse a numeric Retry-After header; None if it is absent or not in seconds (e.g. an HTTP-date)."""
+    try:
+        return max(float(resp.headers["Retry-After"]), 0.0)
+    except (KeyError, ValueError):
+        return None
+
+
+def _wait_retry_after_or_jitter(retry_state: tenacity.RetryCallState) -> float:
+    """
+    Honour a 429's Retry-After header (capped at RETRY_MAX_WAIT); otherwise, or if the header
+    can't be parsed, use jittered exponential backoff.
+    """
+    exc = retry_state.outcome.exception() if retry_state.outcome else None
+    if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 429:
+        retry_after = _retry_after_seconds(exc.response)
+        if retry_after is not None:
+            return min(retry_after, RETRY_MAX_WAIT)
+    return _JITTERED_WAIT(retry_state)
+
+
+# Shared by every async model call: live summaries, marshaled summaries and the streamed answer
+_retry_model_call = tenacity.retry(
+    wait=_wait_retry_after_or_jitter,
+    stop=tenacity.stop_after_attempt(RETRY_ATTEMPTS),
+    retry=tenacity.retry_if_exception(_is_retryable),
+    reraise=True,
+)
+
+
+@_retry_model_call
+async def _apost_json(
+    client: httpx.AsyncClient,
+    api_url: str,
+    headers: dict,
+    payload: dict,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> dict:
+    # the semaphore is held per attempt only, so backoff sleeps don't occupy a slot
+    if semaphore is not None:
+        async with semaphore:
+            resp = await client.post(api_url, headers=headers, json=payload)
+    else:
+        resp = await client.post(api_url, headers=headers, json=payload)
+    resp.raise_for_status()
     return resp.json()
 
 
+@_retry_model_call
+async def _aopen_stream(client: httpx.AsyncClient, api_url: str, headers: dict, payload: dict) -> httpx.Response:
+    """
+    Send a streaming POST and return once the status line is in, retried like _apost_json.
+    Retries can only happen before any body is read; the caller must aclose() the response.
+    """
+    resp = await client.send(client.build_request("POST", api_url, headers=headers, json=payload), stream=True)
+    try:
+        resp.raise_for_status()
+    except httpx.HTTPStatusError:
+        await resp.aclose()
+        raise
+    return resp
+
+
+async def acall_openrouter(
+    client: httpx.AsyncClient,
+    messages: List[dict],
+    api_key: str,
+    model: str = MODEL_DEFAULT,
+    api_url: str = API_URL_DEFAULT,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> dict:
+    """
+    Async variant of call_openrouter; issues the POST on a shared httpx.AsyncClient.
+    If a semaphore is given the request holds it while in flight. Throttled, failed and
+    timed-out requests are retried with jittered exponential backoff (a 429's Retry-After
+    is honoured). Uses get_llm_cache() like call_openrouter.
+    """
+    if not api_key:
+        raise RuntimeError("OPENROUTER_API_KEY not set. Provide the key via st.secrets or environment variable.")
+    key = response_cache_key(model, messages)
+    cache = get_llm_cache()
+    if cache is not None and key in cache:
+        return cache[key]
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    payload = {"model": model, "messages": messages}
+    data = await _apost_json(client, api_url, headers, payload, semaphore=semaphore)
+    if cache is not None and safe_json_get_choice_content(data).strip():
+        cache[key] = data
+    return data
+
+
+async def astream_openrouter(
+    messages: List[dict],
+    api_key: str,
+    model: str = MODEL_DEFAULT,
+    api_url: str = API_URL_DEFAULT,
+) -> AsyncIterator[str]:
+    """
+    Stream a chat completion over SSE, yielding content deltas as they arrive. Opening the
+    stream is retried like acall_openrouter (429/5xx/network errors, Retry-After honoured)
+    before any delta is yielded. A cached response is yielded whole; a stream is written back
+    to the cache only if it ended with `data: [DONE]` and produced content, so truncated or
+    empty answers are never replayed.
+    """
+    if not api_key:
+        raise RuntimeError("OPENROUTER_API_KEY not set. Provide the key via st.secrets or environment variable.")
+    key = response_cache_key(model, messages)
+    cache = get_llm_cache()
+    if cache is not None and key in cache:
+        yield safe_json_get_choice_content(cache[key])
+        return
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    payload = {"model": model, "messages": messages, "stream": True}
+    parts: List[str] = []
+    completed = False
+    resp = await _aopen_stream(get_async_client(), api_url, headers, payload)
+    try:
+        async for line in resp.aiter_lines():
+            # skip blank separators and SSE comments (e.g. ": OPENROUTER PROCESSING")
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:") :].strip()
+            if data == "[DONE]":
+                completed = True
+                break
+            event = json.loads(data)
+            if "error" in event:
+                raise RuntimeError(f"Model stream failed: {json.dumps(event['error'])[:1000]}")
+            choices = event.get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content") or ""
+            if delta:
+                parts.append(delta)
+                yield delta
+    finally:
+        await resp.aclose()
+    if cache is not None and completed and parts:
+        cache[key] = {"choices": [{"message": {"role": "assistant", "content": "".join(parts)}}]}
+
+
+def stream_openrouter(
+    messages: List[dict],
+    api_key: str,
+    model: str = MODEL_DEFAULT,
+    api_url: str = API_URL_DEFAULT,
+) -> Iterator[str]:
+    """Synchronous wrapper around astream_openrouter (e.g. for st.write_stream)."""
+    agen = astream_openrouter(messages, api_key=api_key, model=model, api_url=api_url)
+    try:
+        while True:
+            try:
+                yield run_async(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        run_async(agen.aclose())
+
+
 def safe_json_get_choice_content(resp_json: dict) -> str:
     """Safely extract assistant content from an OpenRouter-like response."""
     choices = resp_json.get("choices")
@@ -165,49 +598,358 @@ def safe_json_get_choice_content(resp_json: dict) -> str:
 # -----------------------
 # High-level operations: summarize, query, follow-ups
 # -----------------------
-def summarize_chunks(chunks: List[str], api_key: str, model: str) -> List[str]:
-    """Ask the model to create short summaries for each chunk (2-3 sentences)."""
+async def _gather_in_waves(calls: List[Callable[[], Awaitable[dict]]], n_chunks: int) -> list:
+    """
+    Run the calls concurrently and return their results (or exceptions) in order. Documents over
+    LARGE_DOC_CHUNKS chunks are sent in waves of SUMMARY_BATCH_SIZE requests, so a rate-limited
+    provider is never hit with the whole document at once.
+    """
+    wave = SUMMARY_BATCH_SIZE if n_chunks > LARGE_DOC_CHUNKS else max(len(calls), 1)
+    results: list = []
+    for start in range(0, len(calls), wave):
+        results.extend(await asyncio.gather(*(call() for call in calls[start : start + wave]), return_exceptions=True))
+    return results
+
+
+async def summarize_chunks(chunks: List[str], api_key: str, model: str, timeout: int = 20) -> List[str]:
+    """
+    Ask the model to create short summaries for each chunk (2-3 sentences).
+    Chunk requests run concurrently, bounded process-wide by get_request_semaphore(); very large
+    documents are processed in waves (see _gather_in_waves). Summaries are returned in chunk order.
+    """
+    semaphore = get_request_semaphore()
+    client = get_async_client(timeout)
+    calls = [
+        functools.partial(
+            acall_openrouter,
+            client,
+            [SUMMARY_SYSTEM_MSG, {"role": "user", "content": f"Chunk {i} of {len(chunks)}:\n\n{chunk}"}],
+            api_key=api_key,
+            model=model,
+            semaphore=semaphore,
+        )
+        for i, chunk in enumerate(chunks, start=1)
+    ]
+    results = await _gather_in_waves(calls, len(chunks))
     summaries = []
-    system_msg = {
-        "role": "system",
-        "content": "You are a concise summarizer. Summarize the following chunk in 2-3 short sentences, focusing on facts that would help answer user questions.",
-    }
-    for i, chunk in enumerate(chunks, start=1):
-        prompt = f"Chunk {i} of {len(chunks)}:\n\n{chunk}"
-        messages = [system_msg, {"role": "user", "content": prompt}]
-        resp = call_openrouter(messages, api_key=api_key, model=model)
-        summaries.append(safe_json_get_choice_content(resp).strip())
+    for result in results:
+        # let every request settle before surfacing the first failure
+        if isinstance(result, BaseException):
+            raise result
+        summaries.append(safe_json_get_choice_content(result).strip())
     return summaries
 
 
-def query_pdf_content(sections: Dict[str, str], question: str, api_key: str, model: str = MODEL_DEFAULT) -> str:
-    """Query the model given structured sections. Summarize chunks if necessary."""
-    content = "\n\n".join(f"{sec}:\n{body}" for sec, body in sections.items())
+def _parse_marshaled_summaries(text: str, expected: int) -> Optional[List[str]]:
+    """Split a 'SUMMARY i: ...' response into `expected` summaries, or None if it doesn't line up."""
+    parts = _MARSHALED_SUMMARY_RE.split(text)
+    # parts = [preamble, "1", body1, "2", body2, ...]
+    by_num = {int(num): body.strip() for num, body in zip(parts[1::2], parts[2::2])}
+    if sorted(by_num) != list(range(1, expected + 1)) or not all(by_num.values()):
+        return None
+    return [by_num[i] for i in range(1, expected + 1)]
+
+
+def _join_numbered(items: List[str], label: str) -> str:
+    """
+    Join items as blank-line-separated numbered blocks, e.g. label "CHUNK {}:\n" gives
+    "CHUNK 1:\n...\n\nCHUNK 2:\n...". Written into one buffer like prepare_document.
+    """
+    buf = io.StringIO()
+    for i, item in enumerate(items, start=1):
+        if i > 1:
+            buf.write("\n\n")
+        buf.write(label.format(i))
+        buf.write(item)
+    return buf.getvalue()
+
+
+async def summarize_chunks_marshaled(
+    chunks: List[str], api_key: str, model: str, K: int = 4, timeout: int = 20
+) -> List[str]:
+    """
+    Like summarize_chunks, but packs K chunks into each request and asks for K numbered
+    summaries, cutting the number of HTTP round-trips (and rate-limit slots) by ~K.
+    Requests share the process-wide semaphore and go out in waves like summarize_chunks.
+    Groups whose reply can't be parsed back into K summaries are re-summarized per chunk,
+    all in one concurrent summarize_chunks pass.
+    """
+    if K <= 1:
+        return await summarize_chunks(chunks, api_key=api_key, model=model, timeout=timeout)
+    groups = [chunks[start : start + K] for start in range(0, len(chunks), K)]
+    semaphore = get_request_semaphore()
+    client = get_async_client(timeout)
+    calls = []
+    for group in groups:
+        body = _join_numbered(group, "CHUNK {}:\n")
+        prompt = (
+            "Summarize each chunk in 2-3 sentences. "
+            "Return as 'SUMMARY i: ...' on separate lines, one per chunk.\n\n"
+            f"{body}"
+        )
+        calls.append(
+            functools.partial(
+                acall_openrouter,
+                client,
+                [MARSHALED_SUMMARY_SYSTEM_MSG, {"role": "user", "content": prompt}],
+                api_key=api_key,
+                model=model,
+                semaphore=semaphore,
+            )
+        )
+    results = await _gather_in_waves(calls, len(chunks))
+    parsed_groups = []
+    retry_chunks: List[str] = []
+    for group, result in zip(groups, results):
+        if isinstance(result, BaseException):
+            raise result
+        parsed = _parse_marshaled_summaries(safe_json_get_choice_content(result), len(group))
+        if parsed is None:
+            retry_chunks.extend(group)
+        parsed_groups.append(parsed)
+    retried = iter(await summarize_chunks(retry_chunks, api_key=api_key, model=model, timeout=timeout))
+    summaries = []
+    for group, parsed in zip(groups, parsed_groups):
+        summaries.extend(parsed if parsed is not None else [next(retried) for _ in group])
+    return summaries
+
+
+def summarize_chunks_batch(
+    chunks: List[str],
+    api_key: str,
+    model: str,
+    api_base: str = BATCH_API_BASE_DEFAULT,
+    poll_interval: float = 10.0,
+    max_wait: float = 3600.0,
+) -> List[str]:
+    """
+    Summarize chunks through an OpenAI-compatible Batch API instead of live completions.
+    Cheaper, but results only arrive once the provider has processed the whole batch.
+    `api_key` must be a key for `api_base` (see get_batch_api_key_from_secrets_or_env).
+    """
+    if not api_key:
+        raise RuntimeError(
+            "Batch API key not set. Provide PDFQA_BATCH_API_KEY or OPENAI_API_KEY via st.secrets or environment variable."
+        )
+    session = create_requests_session()
+    headers = {"Authorization": f"Bearer {api_key}"}
+    # Batch endpoints take bare model ids ("gpt-3.5-turbo"), not OpenRouter's "openai/..." form
+    batch_model = model.split("/", 1)[-1]
+    lines = [
+        json.dumps(
+            {
+                "custom_id": f"chunk-{i}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": batch_model,
+                    "messages": [
+                        SUMMARY_SYSTEM_MSG,
+                        {"role": "user", "content": f"Chunk {i} of {len(chunks)}:\n\n{chunk}"},
+                    ],
+                },
+            }
+        )
+        for i, chunk in enumerate(chunks, start=1)
+    ]
+    resp = session.post(
+        f"{api_base}/files",
+        headers=headers,
+        data={"purpose": "batch"},
+        files={"file": ("summaries.jsonl", "\n".join(lines).encode("utf-8"), "application/jsonl")},
+        timeout=60,
+    )
+    resp.raise_for_status()
+    resp = session.post(
+        f"{api_base}/batches",
+        headers=headers,
+        json={"input_file_id": resp.json()["id"], "endpoint": "/v1/chat/completions", "completion_window": "24h"},
+        timeout=20,
+    )
+    resp.raise_for_status()
+    batch = resp.json()
+
+    deadline = time.monotonic() + max_wait
+    while batch.get("status") != "completed":
+        if batch.get("status") in ("failed", "expired", "cancelled", "cancelling"):
+            raise RuntimeError(f"Batch {batch.get('id')} ended with status {batch.get('status')}: {batch.get('errors')}")
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Batch {batch.get('id')} not completed after {max_wait:.0f}s (status: {batch.get('status')}).")
+        time.sleep(poll_interval)
+        resp = session.get(f"{api_base}/batches/{batch['id']}", headers=headers, timeout=20)
+        resp.raise_for_status()
+        batch = resp.json()
+
+    if not batch.get("output_file_id"):
+        # every request failed: the provider only wrote an error file
+        raise RuntimeError(
+            f"Batch {batch.get('id')} completed without output "
+            f"(request_counts: {batch.get('request_counts')}, error_file_id: {batch.get('error_file_id')})."
+        )
+    resp = session.get(f"{api_base}/files/{batch['output_file_id']}/content", headers=headers, timeout=60)
+    resp.raise_for_status()
+    by_id: Dict[str, str] = {}
+    for line in resp.text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        body = (record.get("response") or {}).get("body")
+        if record.get("error") or not body:
+            raise RuntimeError(f"Batch request {record.get('custom_id')} failed: {json.dumps(record)[:1000]}")
+        by_id[record["custom_id"]] = safe_json_get_choice_content(body).strip()
+    missing = [i for i in range(1, len(chunks) + 1) if f"chunk-{i}" not in by_id]
+    if missing:
+        raise RuntimeError(f"Batch output missing summaries for chunks: {missing}")
+    return [by_id[f"chunk-{i}"] for i in range(1, len(chunks) + 1)]
+
+
+def prepare_document(sections: Dict[str, str]) -> Tuple[str, List[str]]:
+    """Join structured sections into one content string and split it into chunks."""
+    # written piecewise into one buffer instead of formatting a temporary string per section
+    buf = io.StringIO()
+    for i, (sec, body) in enumerate(sections.items()):
+        if i:
+            buf.write("\n\n")
+        buf.write(sec)
+        buf.write(":\n")
+        buf.write(body)
+    content = buf.getvalue()
     if not content.strip():
         raise RuntimeError("Document content is empty after extraction/structuring.")
-    chunks = chunk_text(content, max_chars=3500)
+    encoding = get_token_encoding()
+    if encoding is not None:
+        chunks = chunk_text_by_tokens(content, CHUNK_MAX_TOKENS, encoding)
+    else:
+        chunks = chunk_text(content, max_chars=3500)
+    return content, chunks
+
+
+def fits_direct_prompt(text: str) -> bool:
+    """
+    True if `text` fits a single answer prompt: counted in tokens when a tiktoken encoding is
+    available (dense text and CJK run far below 4 chars/token), else by DIRECT_PROMPT_MAX_CHARS.
+    """
+    encoding = get_token_encoding()
+    if encoding is None:
+        return len(text) <= DIRECT_PROMPT_MAX_CHARS
+    if len(text.encode("utf-8")) <= DIRECT_PROMPT_MAX_TOKENS:
+        # byte-level BPE: every token covers at least one UTF-8 byte (a CJK character is 3 bytes)
+        return True
+    if len(text) > DIRECT_PROMPT_MAX_TOKENS * 10:
+        # no realistic text averages 10+ chars/token; skip encoding very large documents
+        return False
+    return len(encoding.encode(text, disallowed_special=())) <= DIRECT_PROMPT_MAX_TOKENS
+
+
+def needs_summaries(content: str, chunks: List[str]) -> bool:
+    """True if the document is too large to answer from a single direct prompt."""
+    return len(chunks) > 1 and not fits_direct_prompt(content)
+
+
+def prefetch_summaries(sections: Dict[str, str], api_key: str, model: str = MODEL_DEFAULT) -> Optional[Future]:
+    """
+    Start summarizing a large document on the shared event loop before any question is asked.
+    Summaries don't depend on the question, so this overlaps them with the user's think time.
+    Returns None when the document will be answered directly and needs no summaries.
+    """
+    content, chunks = prepare_document(sections)
+    if not needs_summaries(content, chunks):
+        return None
+    return start_async(summarize_chunks_marshaled(chunks, api_key=api_key, model=model, K=CHUNKS_PER_CALL))
+
+
+def build_query_messages(
+    sections: Optional[Dict[str, str]],
+    question: str,
+    api_key: str,
+    model: str = MODEL_DEFAULT,
+    use_batch: bool = False,
+    raw_text: Optional[str] = None,
+    summaries_future: Optional[Future] = None,
+    batch_api_key: str = "",
+) -> List[dict]:
+    """
+    Build the final answer prompt for structured sections. Summarizes chunks first if the
+    document is too large to send directly (via the Batch API with `batch_api_key` when
+    `use_batch` is set). If `raw_text` is given and small enough, it is sent as-is without structuring or chunking;
+    `sections` may be None in that case and is derived from `raw_text` when needed.
+    `summaries_future` (from prefetch_summaries) supplies summaries computed ahead of time; if it
+    failed, its error is raised here (the UI restarts a failed prefetch before the next question).
+    Waiting for live summaries is bounded by SUMMARIES_TIMEOUT.
+    """
     system_msg = {
         "role": "system",
         "content": "You are a helpful assistant. Answer concisely and, where appropriate, mention the section heading you used.",
     }
-    if len(chunks) == 1:
+    if raw_text is not None and raw_text.strip() and fits_direct_prompt(raw_text):
         user_prompt = (
-            f"Document content:\n\n{chunks[0]}"
+            f"Document content:\n\n{raw_text}"
             f"\n\nQuestion: {question}\nAnswer concisely and cite section headings if relevant."
         )
-        messages = [system_msg, {"role": "user", "content": user_prompt}]
-        resp = call_openrouter(messages, api_key=api_key, model=model)
-        return safe_json_get_choice_content(resp)
+        return [system_msg, {"role": "user", "content": user_prompt}]
+    if sections is None:
+        sections = structure_pdf_content(raw_text or "")
+    content, chunks = prepare_document(sections)
+    if not needs_summaries(content, chunks):
+        # Small enough to answer directly: one round-trip, no summarize stage
+        if len(chunks) == 1:
+            document, cite = chunks[0], "section headings"
+        else:
+            document = _join_numbered(chunks, "CHUNK {}:\n")
+            cite = "section headings or chunk numbers"
+        user_prompt = (
+            f"Document content:\n\n{document}"
+            f"\n\nQuestion: {question}\nAnswer concisely and cite {cite} if relevant."
+        )
+        return [system_msg, {"role": "user", "content": user_prompt}]
 
     # For multi-chunk docs, summarize, then ask final question on summaries
-    summaries = summarize_chunks(chunks, api_key=api_key, model=model)
-    combined_summary = "\n\n".join(f"Summary {i+1}: {s}" for i, s in enumerate(summaries))
+    if summaries_future is None and use_batch:
+        summaries = summarize_chunks_batch(chunks, api_key=batch_api_key, model=model)
+    else:
+        owned = summaries_future is None
+        if owned:
+            summaries_future = start_async(
+                summarize_chunks_marshaled(chunks, api_key=api_key, model=model, K=CHUNKS_PER_CALL)
+            )
+        try:
+            summaries = summaries_future.result(timeout=SUMMARIES_TIMEOUT)
+        except FutureTimeoutError:
+            # a prefetch keeps running so a later question can still use it
+            if owned:
+                summaries_future.cancel()
+            raise RuntimeError(
+                f"Summarizing the document took longer than {SUMMARIES_TIMEOUT:.0f}s. Try again shortly."
+            ) from None
+    combined_summary = _join_numbered(summaries, "Summary {}: ")
     final_prompt = (
         "Based on the combined summaries below, answer the question concisely "
         "and indicate which summary/section(s) support the answer.\n\n"
         f"{combined_summary}\n\nQuestion: {question}"
     )
-    resp = call_openrouter([system_msg, {"role": "user", "content": final_prompt}], api_key=api_key, model=model)
+    return [system_msg, {"role": "user", "content": final_prompt}]
+
+
+def query_pdf_content(
+    sections: Optional[Dict[str, str]],
+    question: str,
+    api_key: str,
+    model: str = MODEL_DEFAULT,
+    use_batch: bool = False,
+    raw_text: Optional[str] = None,
+    batch_api_key: str = "",
+) -> str:
+    """Query the model given structured sections (or raw text) and return the full answer."""
+    messages = build_query_messages(
+        sections,
+        question,
+        api_key=api_key,
+        model=model,
+        use_batch=use_batch,
+        raw_text=raw_text,
+        batch_api_key=batch_api_key,
+    )
+    resp = call_openrouter(messages, api_key=api_key, model=model)
     return safe_json_get_choice_content(resp)
 
 
@@ -222,7 +964,7 @@ def generate_followup_questions(answer_text: str, api_key: str, model: str = MOD
     resp = call_openrouter([system_msg, {"role": "user", "content": prompt}], api_key=api_key, model=model)
     text = safe_json_get_choice_content(resp)
     raw_lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-    cleaned = [re.sub(r"^\s*\d+[\).\s-]*", "", q) for q in raw_lines]
+    cleaned = [_NUMBER_PREFIX_RE.sub("", q) for q in raw_lines]
     return cleaned if cleaned else ["❌ No follow-up questions available."]
 
 
@@ -243,6 +985,17 @@ if api_key_input:
 
 model_name = st.sidebar.text_input("Model name", value=MODEL_DEFAULT)
 api_url = st.sidebar.text_input("API URL", value=API_URL_DEFAULT)
+batch_api_key = get_batch_api_key_from_secrets_or_env()
+batch_api_key_input = st.sidebar.text_input("Batch API key (paste to override)", type="password")
+if batch_api_key_input:
+    batch_api_key = batch_api_key_input.strip()
+use_batch_api = st.sidebar.checkbox(
+    "Use Batch API (cheaper, slower)",
+    value=False,
+    disabled=not batch_api_key,
+    help=f"Summarize long documents via the Batch API at {BATCH_API_BASE_DEFAULT}. "
+    "Needs its own key (PDFQA_BATCH_API_KEY or OPENAI_API_KEY); results can take minutes.",
+) and bool(batch_api_key)
 
 st.sidebar.markdown(
     """
@@ -256,13 +1009,42 @@ How to set the API key:
 
 uploaded_file = st.file_uploader("Upload a PDF file", type=["pdf"])
 if uploaded_file is not None:
-    file_bytes = uploaded_file.read()
+    # getvalue() hands back the upload's own bytes object (BytesIO copy-on-write), and
+    # fitz.open(stream=bytes) reads that buffer in place, so the PDF is held in memory once
+    file_bytes = uploaded_file.getvalue()
+    # hash each upload once; identical PDFs (renamed or from other sessions) share a digest
+    if st.session_state.get("doc_id") != uploaded_file.file_id:
+        st.session_state["doc_id"] = uploaded_file.file_id
+        st.session_state["doc_digest"] = hashlib.sha1(file_bytes).hexdigest()
+    doc_digest = st.session_state["doc_digest"]
     with st.spinner("Extracting text from PDF..."):
-        raw_text = extract_text_from_pdf_bytes(file_bytes)
+        raw_text = extract_text_from_pdf_bytes(doc_digest, file_bytes)
     if not raw_text:
         st.error("Failed to extract text from PDF. The file may be scanned (image-only) or corrupted.")
     else:
-        sections = structure_pdf_content(raw_text)
+        # structure once per document, and only when it is too big to send raw
+        if st.session_state.get("sections_digest") != doc_digest:
+            st.session_state["sections_digest"] = doc_digest
+            st.session_state["sections"] = (
+                None if fits_direct_prompt(raw_text) else structure_pdf_content(raw_text)
+            )
+        sections = st.session_state["sections"]
+        # start question-independent summaries now; restarted on new upload, model or key
+        prefetch_key = (doc_digest, model_name, api_key)
+        if not (sections is not None and api_key and not use_batch_api):
+            prefetch_key = None
+        if st.session_state.get("summaries_key") != prefetch_key:
+            # stop the superseded run so its calls don't keep spending quota and concurrency slots
+            stale_future = st.session_state.get("summaries_future")
+            if stale_future is not None:
+                stale_future.cancel()
+            st.session_state["summaries_key"] = prefetch_key
+            st.session_state["summaries_future"] = None
+            if prefetch_key is not None:
+                try:
+                    st.session_state["summaries_future"] = prefetch_summaries(sections, api_key, model_name)
+                except Exception:
+                    st.session_state["summaries_future"] = None
         st.success("PDF processed successfully!")
 
         st.subheader("Document preview")
@@ -277,21 +1059,38 @@ if uploaded_file is not None:
                     "or paste a temporary key in sidebar."
                 )
             else:
-                with st.spinner("Querying model..."):
-                    try:
-                        answer = query_pdf_content(sections, question, api_key=api_key, model=model_name)
-                        st.subheader("Answer")
-                        st.write(answer)
-                        with st.expander("Follow-up Questions"):
-                            try:
-                                followups = generate_followup_questions(
-                                    answer, api_key=api_key, model=model_name
-                                )
-                                for idx, fq in enumerate(followups, start=1):
-                                    st.write(f"{idx}. {fq}")
-                            except Exception as e:
-                                st.write("Could not generate follow-up questions:", e)
-                    except Exception as e:
-                        st.error(f"Failed to get answer: {e}")
+                summaries_future = st.session_state.get("summaries_future")
+                if summaries_future is not None and summaries_future.done():
+                    if summaries_future.cancelled() or summaries_future.exception() is not None:
+                        # the prefetch failed (e.g. an outage outlasting its retries): rerun it and
+                        # keep the new future, so its summaries serve this and later questions
+                        try:
+                            st.session_state["summaries_future"] = prefetch_summaries(sections, api_key, model_name)
+                        except Exception:
+                            st.session_state["summaries_future"] = None
+                try:
+                    with st.spinner("Querying model..."):
+                        messages = build_query_messages(
+                            sections,
+                            question,
+                            api_key=api_key,
+                            model=model_name,
+                            use_batch=use_batch_api,
+                            raw_text=raw_text,
+                            summaries_future=st.session_state.get("summaries_future"),
+                            batch_api_key=batch_api_key,
+                        )
+                    st.subheader("Answer")
+                    # stream only the final answer; summaries above are needed whole
+                    answer = st.write_stream(stream_openrouter(messages, api_key=api_key, model=model_name))
+                    with st.expander("Follow-up Questions"):
+                        try:
+                            followups = generate_followup_questions(answer, api_key=api_key, model=model_name)
+                            for idx, fq in enumerate(followups, start=1):
+                                st.write(f"{idx}. {fq}")
+                        except Exception as e:
+                            st.write("Could not generate follow-up questions:", e)
+                except Exception as e:
+                    st.error(f"Failed to get answer: {e}")
 else:
     st.info("Please upload a PDF to get started. Use the sidebar to provide your OPENROUTER_API_KEY if needed.")
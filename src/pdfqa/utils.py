@@ -7,23 +7,38 @@ OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY") or os.environ.get("OPE
 API_URL = os.environ.get("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
 MODEL_NAME = os.environ.get("OPENROUTER_MODEL", "openai/gpt-3.5-turbo-0613")
 
+# Plain-text extraction flags: expand ligatures (e.g. "\ufb01" -> "fi") and skip image handling
+TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES & ~fitz.TEXT_PRESERVE_IMAGES
+
+_HEADING_RE = re.compile(r"^(?:CHAPTER|SECTION|PART|INTRODUCTION|CONCLUSION|SUMMARY|APPENDIX)\b", re.IGNORECASE)
+_NUMBER_PREFIX_RE = re.compile(r"^\s*\d+[\).\s-]*")
+
 def extract_text_from_pdf_bytes(file_bytes: bytes) -> str:
     try:
         doc = fitz.open(stream=file_bytes, filetype="pdf")
-        pages = [page.get_text("text") for page in doc]
+        pages = [page.get_text("text", flags=TEXT_FLAGS) for page in doc]
         return "\n".join(pages).strip()
     except Exception as e:
         return ""
 
+# Per-process document handle for parallel extraction (see init_extract_worker)
+_worker_doc = None
+
+def init_extract_worker(path: str) -> None:
+    global _worker_doc
+    _worker_doc = fitz.open(path, filetype="pdf")
+
+def extract_page_range(start: int, stop: int) -> List[str]:
+    return [_worker_doc[i].get_text("text", flags=TEXT_FLAGS) for i in range(start, stop)]
+
 def structure_pdf_content(raw_text: str) -> Dict[str, str]:
     sections: Dict[str, list] = {"Introduction": []}
     current = "Introduction"
-    heading_pattern = re.compile(r"^(?:CHAPTER|SECTION|PART|INTRODUCTION|CONCLUSION|SUMMARY|APPENDIX)\\b", re.IGNORECASE)
     for line in raw_text.splitlines():
         line = line.strip()
         if not line:
             continue
-        if line.isupper() or heading_pattern.match(line):
+        if line.isupper() or _HEADING_RE.match(line):
             current = line
             sections.setdefault(current, [])
         else:
@@ -96,5 +111,5 @@ def generate_followup_questions(answer: str) -> List[str]:
     resp = call_openrouter([system_msg, {"role": "user", "content": prompt}])
     text = safe_json_get_choice_content(resp)
     raw_lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-    cleaned = [re.sub(r'^\\s*\\d+[\\).\\s-]*', '', q) for q in raw_lines]
+    cleaned = [_NUMBER_PREFIX_RE.sub('', q) for q in raw_lines]
     return cleaned if cleaned else ["❌ No follow-up questions available."]
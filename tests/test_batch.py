@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+import app
+
+class _Resp:
+    def __init__(self, payload=None, text=""):
+        self._payload = payload
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._payload
+
+class _Session:
+    """Stub of the requests session for an OpenAI-style batch that completes immediately."""
+
+    def __init__(self, output_lines, batch=None):
+        self.output = "\n".join(json.dumps(line) for line in output_lines)
+        self.batch = batch or {"id": "b1", "status": "completed", "output_file_id": "out1"}
+
+    def post(self, url, **kwargs):
+        if url.endswith("/files"):
+            return _Resp({"id": "in1"})
+        return _Resp(self.batch)
+
+    def get(self, url, **kwargs):
+        if url.endswith("/content"):
+            return _Resp(text=self.output)
+        return _Resp(self.batch)
+
+def _record(custom_id, content):
+    body = {"choices": [{"message": {"role": "assistant", "content": content}}]}
+    return {"custom_id": custom_id, "response": {"status_code": 200, "body": body}, "error": None}
+
+def _run(monkeypatch, session, chunks):
+    monkeypatch.setattr(app, "create_requests_session", lambda: session)
+    return app.summarize_chunks_batch(chunks, api_key="k", model="openai/gpt-3.5-turbo")
+
+def test_batch_maps_output_by_custom_id(monkeypatch):
+    # providers may write output lines in any order
+    session = _Session([_record("chunk-3", "c"), _record("chunk-1", " a "), _record("chunk-2", "b")])
+    assert _run(monkeypatch, session, ["x", "y", "z"]) == ["a", "b", "c"]
+
+def test_batch_reports_missing_records(monkeypatch):
+    session = _Session([_record("chunk-1", "a")])
+    with pytest.raises(RuntimeError, match=r"missing summaries for chunks: \[2\]"):
+        _run(monkeypatch, session, ["x", "y"])
+
+def test_batch_reports_failed_records(monkeypatch):
+    failed = {"custom_id": "chunk-2", "response": None, "error": {"code": "server_error"}}
+    session = _Session([_record("chunk-1", "a"), failed])
+    with pytest.raises(RuntimeError, match="chunk-2 failed"):
+        _run(monkeypatch, session, ["x", "y"])
+
+def test_batch_without_output_file(monkeypatch):
+    batch = {"id": "b1", "status": "completed", "output_file_id": None, "error_file_id": "err1"}
+    with pytest.raises(RuntimeError, match="without output"):
+        _run(monkeypatch, _Session([], batch=batch), ["x"])
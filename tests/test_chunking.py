@@ -0,0 +1,48 @@
+import pytest
+
+import app
+from app import chunk_text_by_tokens
+
+tiktoken = pytest.importorskip("tiktoken")
+
+# byte-level encoding: one token per byte, built locally so no BPE download is needed
+ENCODING = tiktoken.Encoding(
+    name="test_bytes",
+    pat_str=r"""\S+|\s+""",
+    mergeable_ranks={bytes([i]): i for i in range(256)},
+    special_tokens={},
+)
+
+def test_chunk_by_tokens_respects_bound():
+    text = " ".join(f"word{i}" for i in range(200))
+    chunks = chunk_text_by_tokens(text, 50, ENCODING)
+    assert len(chunks) > 1
+    assert all(len(ENCODING.encode(chunk)) <= 50 for chunk in chunks)
+
+def test_chunk_by_tokens_prefers_newline():
+    text = "first line here\nsecond line that keeps going past the limit"
+    chunks = chunk_text_by_tokens(text, 30, ENCODING)
+    assert chunks[0] == "first line here"
+
+def test_chunk_by_tokens_preserves_content():
+    text = "alpha beta\ngamma delta epsilon\nzeta eta theta iota kappa\nlambda mu"
+    chunks = chunk_text_by_tokens(text, 16, ENCODING)
+    assert " ".join(chunks).split() == text.split()
+    assert chunk_text_by_tokens("short", 16, ENCODING) == ["short"]
+
+def test_fits_direct_prompt_counts_multibyte_tokens(monkeypatch):
+    monkeypatch.setattr(app, "get_token_encoding", lambda: ENCODING)
+    limit = app.DIRECT_PROMPT_MAX_TOKENS
+    assert app.fits_direct_prompt("a" * limit)
+    assert not app.fits_direct_prompt("a" * (limit + 1))
+    # fewer characters than the limit, but three tokens per character
+    assert not app.fits_direct_prompt("中" * (limit - 1))
+    assert app.fits_direct_prompt("中" * (limit // 3))
+
+def test_chunk_by_tokens_keeps_unspaced_cjk_whole():
+    text = "中文" * 100
+    chunks = chunk_text_by_tokens(text, 50, ENCODING)
+    assert len(chunks) > 1
+    assert all(len(ENCODING.encode(chunk)) <= 50 for chunk in chunks)
+    assert "�" not in "".join(chunks)
+    assert "".join(chunks) == text
@@ -0,0 +1,36 @@
+import httpx
+import tenacity
+
+from app import RETRY_MAX_WAIT, _is_retryable, _wait_retry_after_or_jitter
+
+def _status_error(status, headers=None):
+    request = httpx.Request("POST", "https://example.test/v1/chat/completions")
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError(f"{status}", request=request, response=response)
+
+def _retry_state(exc, attempt=1):
+    state = tenacity.RetryCallState(tenacity.Retrying(), fn=None, args=(), kwargs={})
+    state.attempt_number = attempt
+    state.set_exception((type(exc), exc, None))
+    return state
+
+def test_retryable_statuses():
+    for status in (429, 500, 502, 503, 504):
+        assert _is_retryable(_status_error(status))
+    for status in (400, 401, 403, 404):
+        assert not _is_retryable(_status_error(status))
+
+def test_retryable_transport_errors():
+    assert _is_retryable(httpx.ConnectError("refused"))
+    assert _is_retryable(httpx.ReadTimeout("slow"))
+    assert not _is_retryable(ValueError("bad json"))
+
+def test_retry_after_honoured_and_capped():
+    assert _wait_retry_after_or_jitter(_retry_state(_status_error(429, {"Retry-After": "3"}))) == 3.0
+    assert _wait_retry_after_or_jitter(_retry_state(_status_error(429, {"Retry-After": "3600"}))) == RETRY_MAX_WAIT
+
+def test_unparsable_retry_after_uses_jitter():
+    headers = {"Retry-After": "Wed, 21 Oct 2026 07:28:00 GMT"}
+    waits = {_wait_retry_after_or_jitter(_retry_state(_status_error(429, headers), attempt=3)) for _ in range(20)}
+    assert all(0 <= w <= RETRY_MAX_WAIT for w in waits)
+    assert len(waits) > 1
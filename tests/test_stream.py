@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import app
+
+def _sse(*events):
+    return "".join(f"{e}\n\n" for e in events)
+
+def _delta(text):
+    return "data: " + json.dumps({"choices": [{"delta": {"content": text}}]})
+
+def _stream(monkeypatch, responses, messages=None):
+    """Run astream_openrouter against canned responses; returns (deltas, cache, request count)."""
+    cache = {}
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return responses[min(len(calls), len(responses)) - 1]
+
+    monkeypatch.setattr(app, "get_llm_cache", lambda: cache)
+    monkeypatch.setattr(
+        app, "get_async_client", lambda timeout=20: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    messages = messages or [{"role": "user", "content": "q"}]
+
+    async def collect():
+        return [d async for d in app.astream_openrouter(messages, api_key="k")]
+
+    return asyncio.run(collect()), cache, len(calls)
+
+def test_stream_parses_deltas_and_caches_on_done(monkeypatch):
+    body = _sse(": OPENROUTER PROCESSING", _delta("Hel"), "data: {\"choices\": [{\"delta\": {}}]}", _delta("lo"), "data: [DONE]")
+    deltas, cache, _ = _stream(monkeypatch, [httpx.Response(200, text=body)])
+    assert deltas == ["Hel", "lo"]
+    assert [app.safe_json_get_choice_content(v) for v in cache.values()] == ["Hello"]
+
+def test_stream_without_done_is_not_cached(monkeypatch):
+    deltas, cache, _ = _stream(monkeypatch, [httpx.Response(200, text=_sse(_delta("partial")))])
+    assert deltas == ["partial"]
+    assert cache == {}
+
+def test_stream_empty_answer_is_not_cached(monkeypatch):
+    deltas, cache, _ = _stream(monkeypatch, [httpx.Response(200, text=_sse("data: [DONE]"))])
+    assert deltas == []
+    assert cache == {}
+
+def test_stream_error_event_raises(monkeypatch):
+    body = _sse(_delta("a"), "data: " + json.dumps({"error": {"message": "overloaded"}}))
+    with pytest.raises(RuntimeError, match="overloaded"):
+        _stream(monkeypatch, [httpx.Response(200, text=body)])
+
+def test_stream_retries_before_first_delta(monkeypatch):
+    throttled = httpx.Response(429, headers={"Retry-After": "0"})
+    ok = httpx.Response(200, text=_sse(_delta("ok"), "data: [DONE]"))
+    deltas, _, calls = _stream(monkeypatch, [throttled, ok])
+    assert deltas == ["ok"]
+    assert calls == 2
+
+def test_stream_does_not_retry_auth_errors(monkeypatch):
+    with pytest.raises(httpx.HTTPStatusError):
+        _stream(monkeypatch, [httpx.Response(401)])
@@ -6,3 +6,8 @@ def test_structure_basic():
     assert "INTRODUCTION" in sections or "Introduction" in sections
     # ensure some content extracted
     assert any(len(v) > 0 for v in sections.values())
+
+def test_structure_keyword_heading():
+    text = "Intro text.\nConclusion of the study\nFinal notes."
+    sections = structure_pdf_content(text)
+    assert sections["Conclusion of the study"] == "Final notes."
@@ -0,0 +1,13 @@
+from app import _parse_marshaled_summaries
+
+def test_parse_marshaled_plain():
+    text = "SUMMARY 1: First chunk.\nSUMMARY 2: Second chunk."
+    assert _parse_marshaled_summaries(text, 2) == ["First chunk.", "Second chunk."]
+
+def test_parse_marshaled_markdown():
+    text = "Here you go:\n**SUMMARY 1:** a\n**SUMMARY 2:** b"
+    assert _parse_marshaled_summaries(text, 2) == ["a", "b"]
+
+def test_parse_marshaled_mismatch():
+    assert _parse_marshaled_summaries("SUMMARY 1: only one", 2) is None
+    assert _parse_marshaled_summaries("SUMMARY 1: a\nSUMMARY 2:", 2) is None